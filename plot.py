@@ -1,37 +1,212 @@
-from json import load
-import matplotlib.pyplot as plt
-from sort_lib import insertion_sort_alg
-from sort_lib import bubble_sort_alg
-from sort_lib import merge_sort_alg
-from timeit import repeat
+from json import load, dump, dumps
+from hashlib import sha256
+from inspect import getsource, isfunction
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import Queue
+import os
+import sort_lib
+from timeit import Timer
 
+# Name of the file holding timing results from earlier runs.
+CACHE_FILE = "timing_cache.json"
 
-def run_algorithm(algorithm, n):
+# Target number of seconds for timing each (algorithm, number of files) cell.
+# Cells where a single call takes longer than TIME_BUDGET / REPEATS run past it.
+TIME_BUDGET = 2.0
+
+# Number of times each cell is timed. The lowest time is plotted.
+REPEATS = 3
+
+
+def run_algorithm(algorithm, n, budget=TIME_BUDGET, repeats=REPEATS):
     '''
     Receives:   algorithm: a string indicating the name of a sorting
-                function to call.
+                function in sort_lib to call.
+
+                n: the list of file data to sort.
+
+                budget: the target number of seconds to spend timing.
+
+                repeats: the number of times to repeat the timing.
+
+    The function times one call of the algorithm, and uses this to pick
+    how many calls fit in each of the repeats within the time budget.
+    If only one call fits, the first call is kept as one of the repeats.
+    Every repeat runs at least one call, so a cell takes at least repeats
+    calls, which is longer than budget for slow cells.
+
+    A fresh copy of n is made with list(data) and sorted on every call,
+    since the sorting functions sort in place. The O(n) copy is included
+    in the times, so they can not be compared directly with times from
+    the older version of this function, which ran each algorithm 1000
+    times on a list written out in the timed statement.
+
+    Returns: A list of floats indicating the time in milliseconds of a
+             single call, one for each repeat.
+    '''
+    timer = Timer("algorithm(list(data))",
+                  globals={"algorithm": getattr(sort_lib, algorithm),
+                           "data": n})
+    first = timer.timeit(number=1)
+    number = max(1, int(budget / repeats / max(first, 1e-9)))
+    if number == 1:
+        times = [first] + timer.repeat(repeat=repeats - 1, number=1)
+    else:
+        times = timer.repeat(repeat=repeats, number=number)
+    return [time / number * 1000 for time in times]
+
+
+def algorithm_source(algorithm, seen=None):
+    '''
+    Returns the source code of the sorting function named algorithm, followed
+    by the source code of every function in sort_lib that it calls, such as
+    merge for merge_sort_alg.
+    '''
+    if seen is None:
+        seen = set()
+    seen.add(algorithm)
+    function = getattr(sort_lib, algorithm)
+    source = getsource(function)
+    for name in function.__code__.co_names:
+        if name not in seen and isfunction(getattr(sort_lib, name, None)):
+            source += algorithm_source(name, seen)
+    return source
+
+
+def cell_key(algorithm, data, budget=TIME_BUDGET, repeats=REPEATS):
+    '''
+    Returns the key used in the cache file for an algorithm sorting the list
+    data.
+
+    The key ends with a fingerprint of the data, the source code of the
+    algorithm and the timing settings. If any of them change, for example
+    after scrape.py has written a new file_data.json, the key changes and
+    the cell is timed again instead of reusing an old result.
+    '''
+    fingerprint = sha256()
+    fingerprint.update(dumps(data).encode())
+    fingerprint.update(algorithm_source(algorithm).encode())
+    fingerprint.update(f"{budget}:{repeats}".encode())
+    return f"{algorithm}:{len(data)}:{fingerprint.hexdigest()[:16]}"
+
+
+def load_cache():
+    '''
+    Opens and loads timing results saved by earlier runs.
+
+    Returns: A dictionary mapping cell_key strings to times in milliseconds.
+             The dictionary is empty if there is no cache file yet.
+    '''
+    try:
+        with open(CACHE_FILE, "r") as cache_file:
+            return load(cache_file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_cache(cache):
+    '''
+    Writes the timing results to the cache file.
+
+    The results are written to a temporary file first, so an interrupted run
+    never leaves a half written cache file behind.
+    '''
+    with open(CACHE_FILE + ".tmp", "w") as cache_file:
+        dump(cache, cache_file, indent=1, sort_keys=True)
+    os.replace(CACHE_FILE + ".tmp", CACHE_FILE)
+
+
+def pin_worker(cores):
+    '''
+    Pins the calling worker process to a core taken from the queue cores,
+    so that the workers do not compete for the same core while timing.
+    Does nothing on platforms without os.sched_setaffinity.
+    '''
+    core = cores.get()
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {core})
 
-                n: an integer indicating the number of files to sort.
 
-    The function uses timeit.repeat to calculate the number of seconds
-    it takes to run an algorithm 1000 times.
+def time_cell(key, algorithm, data, budget, repeats):
+    '''
+    Worker function for the process pool.
+
+    Returns: key and the lowest time from run_algorithm.
+    '''
+    return key, min(run_algorithm(algorithm, data, budget, repeats))
+
+
+def time_missing_cells(algs_data, sizes, file_data, cache,
+                       budget=TIME_BUDGET, repeats=REPEATS):
+    '''
+    Times every (algorithm, number of files) cell that is not in cache.
+    Entries in cache for one of the cells but with an old fingerprint, such
+    as results for old data or an old version of an algorithm, are dropped.
+    Entries for algorithms or numbers of files that are not in this run are
+    kept.
 
-    It repeats this 3 times and saves the times as a list.
-    Source: This function was supplied as part of the assignment.
+    The cells are run in parallel in a process pool with one worker per
+    available core. The largest cells are submitted first, so that the slow
+    cells do not end up running alone at the end.
 
-    Returns: A list of floats inciating times in seconds.
+    The cache is saved as soon as each cell finishes, so an interrupted
+    run only has to time the cells that were not finished. When the run is
+    stopped with Ctrl-C, the cells that have not started are cancelled,
+    and only the cells already running are finished. A cell that
+    raises an exception is reported and left out of the cache, and the
+    other cells are still timed and cached.
     '''
-    # To give the timeit module access to functions you define, you can
-    # pass a setup parameter which contains an import statement:
-    setup_code = f"from __main__ import {algorithm}"
+    cells = {cell_key(alg[0], file_data[:n], budget, repeats): (alg[0], n)
+             for alg in algs_data for n in sizes}
+    prefixes = {key.rsplit(":", 1)[0] for key in cells}
+    stale = [key for key in cache
+             if key not in cells and key.rsplit(":", 1)[0] in prefixes]
+    for key in stale:
+        del cache[key]
+    if stale:
+        save_cache(cache)
 
-    # call to the function as text. Repeats the execution.
-    times = repeat(f"{algorithm}({n})", setup=setup_code, repeat=3,
-                   number=1000)
-    # Pay attention to the fact that the output is the execution time of number
-    # times iteration of the code snippet, not the single iteration.
-    # For a single iteration exec. time, divide the output time by number.
-    return times
+    missing = [(key, algorithm, n) for key, (algorithm, n) in cells.items()
+               if key not in cache]
+    if not missing:
+        return
+    missing.sort(key=lambda cell: cell[2], reverse=True)
+
+    if hasattr(os, "sched_getaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = list(range(os.cpu_count() or 1))
+    workers = min(len(cores), len(missing))
+    core_queue = Queue()
+    for core in cores[:workers]:
+        core_queue.put(core)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=pin_worker,
+                             initargs=(core_queue,)) as executor:
+        futures = {executor.submit(time_cell, key, algorithm, file_data[:n],
+                                   budget, repeats): (algorithm, n)
+                   for key, algorithm, n in missing}
+        try:
+            for future in as_completed(futures):
+                try:
+                    key, time = future.result()
+                except Exception as exc:
+                    algorithm, n = futures[future]
+                    print(f"There was a problem timing {algorithm} on {n} "
+                          f"files. The result was not cached.\n"
+                          f"Error: {exc}")
+                    continue
+                cache[key] = time
+                save_cache(cache)
+        except KeyboardInterrupt:
+            # Cancel the queued cells, so leaving the with block does not
+            # wait for them to be timed. Each future is cancelled here, since
+            # the shutdown in the with block would otherwise race with
+            # cancel_futures and reset it.
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
 
 
 def get_data():
@@ -78,27 +253,37 @@ def main():
     The structure of algs_data is explained in the documentation for the
     setup_data_to_sort_time_plot function.
 
-    For each sorting algorithm:
-        Calls run_algorithm to get timing data for different numbers of files.
+    Calls load_cache to get the timing results from earlier runs, and
+    time_missing_cells to time the cells that are not cached yet. Cells
+    whose data, algorithm or timing settings have changed are timed again.
 
+    For each sorting algorithm:
         Number of files is saved as X-coordinates.
 
-        The minimum times from the lists returned by run_algorithm are saved as
-        y-coordinates.
+        The minimum times from the cache are saved as y-coordinates.
 
         Writes some debugging info to log_file.
 
         The data is sent to the plt.plot function.
     The axis labels and legend for the plot are generated.
     The plot is saved.
+
+    matplotlib is imported here rather than at the top of the file, so the
+    timing functions can be imported without it.
     '''
+    import matplotlib.pyplot as plt
     file_data = get_data()
     algs_data = setup_data_to_sort_time_plot()
+    sizes = range(100, 2301, 200)   # Number of files to sort
+    cache = load_cache()
+    time_missing_cells(algs_data, sizes, file_data, cache)
     with open("timing_data_log_file.txt", "w") as log_file:
         for i in range(len(algs_data)):         # For each sorting algorithm
-            for n in range(100, 2301, 200):     # Number of files to sort    
-                # Get lowest time from run_algorithm function
-                times = min(run_algorithm(algs_data[i][0], file_data[:n]))
+            for n in sizes:
+                key = cell_key(algs_data[i][0], file_data[:n])
+                if key not in cache:            # Skip cells that failed
+                    continue
+                times = cache[key]
                 algs_data[i][1].append(n)       # Save x-coordinate data in algs_data
                 algs_data[i][2].append(times)   # Save y-coordinate data in algs_data
             log_file.write(f"X-coordinates for algorithm {algs_data[i][0]} are {algs_data[i][1]}\n")
@@ -113,4 +298,5 @@ def main():
     plt.savefig('plot_of_sorting_times.png')
 
 
-main()
+if __name__ == "__main__":
+    main()
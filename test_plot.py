@@ -0,0 +1,116 @@
+import json
+import os
+
+import pytest
+
+import plot
+
+
+ALGS_DATA = (["insertion_sort_alg"], ["merge_sort_alg"])
+FILE_DATA = [[f"image_{i}.png", (i * 7919) % 1000] for i in range(20)]
+SIZES = [5, 10]
+BUDGET = 0.01
+REPEATS = 2
+
+
+def keys_for(algs_data, sizes, file_data):
+    return {plot.cell_key(alg[0], file_data[:n], BUDGET, REPEATS)
+            for alg in algs_data for n in sizes}
+
+
+def test_run_algorithm_returns_one_time_per_repeat():
+    times = plot.run_algorithm("merge_sort_alg", FILE_DATA, BUDGET, REPEATS)
+    assert len(times) == REPEATS
+    assert all(time > 0 for time in times)
+
+
+def test_cell_key_changes_with_data_and_settings():
+    key = plot.cell_key("merge_sort_alg", FILE_DATA, BUDGET, REPEATS)
+    assert key.startswith("merge_sort_alg:20:")
+    assert key != plot.cell_key("merge_sort_alg", FILE_DATA[::-1],
+                                BUDGET, REPEATS)
+    assert key != plot.cell_key("merge_sort_alg", FILE_DATA,
+                                BUDGET * 2, REPEATS)
+
+
+def test_algorithm_source_includes_helpers():
+    assert "def merge(" in plot.algorithm_source("merge_sort_alg")
+
+
+def test_only_missing_cells_are_timed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cached_key = plot.cell_key("insertion_sort_alg", FILE_DATA[:5],
+                               BUDGET, REPEATS)
+    other_keys = {"bubble_sort_alg:5:0123456789abcdef": -3.0,
+                  "merge_sort_alg:15:0123456789abcdef": -4.0}
+    cache = {cached_key: -1.0, "merge_sort_alg:5:stale": -2.0, **other_keys}
+
+    plot.time_missing_cells(ALGS_DATA, SIZES, FILE_DATA, cache,
+                            BUDGET, REPEATS)
+
+    expected = keys_for(ALGS_DATA, SIZES, FILE_DATA) | set(other_keys)
+    assert set(cache) == expected
+    assert cache[cached_key] == -1.0
+    assert all(time > 0 for key, time in cache.items()
+               if key != cached_key and key not in other_keys)
+    assert all(cache[key] == time for key, time in other_keys.items())
+    assert plot.load_cache() == cache
+
+
+def test_cache_file_is_replaced_atomically(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    real_replace = os.replace
+    replaced = []
+
+    def recording_replace(src, dst):
+        with open(src) as tmp_file:
+            json.load(tmp_file)         # The temporary file is complete
+        replaced.append((src, dst))
+        real_replace(src, dst)
+
+    monkeypatch.setattr(plot.os, "replace", recording_replace)
+    cache = {}
+    plot.time_missing_cells(ALGS_DATA, SIZES, FILE_DATA, cache,
+                            BUDGET, REPEATS)
+
+    cells = len(ALGS_DATA) * len(SIZES)
+    assert replaced == [(plot.CACHE_FILE + ".tmp", plot.CACHE_FILE)] * cells
+    assert not os.path.exists(plot.CACHE_FILE + ".tmp")
+
+
+def test_failing_cell_does_not_stop_other_cells(tmp_path, monkeypatch,
+                                                capsys):
+    monkeypatch.chdir(tmp_path)
+    # Integers can not be indexed, so sorting more than one of them fails.
+    file_data = [1, 2, 3]
+    cache = {}
+    plot.time_missing_cells((["bubble_sort_alg"],), [1, 3], file_data, cache,
+                            BUDGET, REPEATS)
+
+    assert set(cache) == keys_for((["bubble_sort_alg"],), [1], file_data)
+    assert "timing bubble_sort_alg on 3 files" in capsys.readouterr().out
+
+
+def test_interrupt_cancels_pending_cells(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    futures = []
+    as_completed = plot.as_completed
+
+    def interrupted_as_completed(fs):
+        futures.extend(fs)
+        yield next(as_completed(fs))
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(plot, "as_completed", interrupted_as_completed)
+    # Enough cells, each taking about 0.1 s, that most of them are still
+    # queued when the first one finishes.
+    sizes = range(1, (os.cpu_count() or 1) * 2 + 12)
+    cache = {}
+    with pytest.raises(KeyboardInterrupt):
+        plot.time_missing_cells((["merge_sort_alg"],), sizes, FILE_DATA,
+                                cache, 0.1, REPEATS)
+
+    cancelled = [future for future in futures if future.cancelled()]
+    assert len(cancelled) >= len(futures) - 2 * (os.cpu_count() or 1) - 2
+    assert len(cache) == 1
+    assert plot.load_cache() == cache